@@ -0,0 +1,182 @@
+"""
+Authentification par token signé (JWT HS256)
+- Clés chargées depuis la configuration, identifiées par "kid" (rotation)
+- Cache LRU borné des tokens déjà vérifiés, indexé par hash du token
+"""
+
+from collections import OrderedDict
+import base64
+import click
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+
+class TokenError(Exception):
+    """Token absent, mal formé, mal signé ou expiré"""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def parse_signing_keys(value):
+    """
+    Parse "kid1:secret1,kid2:secret2".
+    La première clé est la clé active (signature), les suivantes
+    restent acceptées en vérification le temps de la rotation.
+    """
+    keys = OrderedDict()
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        kid, sep, secret = item.partition(':')
+        if not sep or not kid or not secret:
+            raise ValueError(f'Invalid signing key entry for kid {kid!r}')
+        keys[kid] = secret.encode()
+    return keys
+
+
+class TokenVerifier:
+    """Vérifie les tokens et garde en cache ceux déjà validés"""
+
+    def __init__(self, keys, cache_size=1024, leeway=0):
+        if not keys:
+            raise ValueError('At least one signing key is required')
+        self.keys = OrderedDict(keys)
+        self.cache_size = cache_size
+        self.leeway = leeway
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active_kid(self):
+        return next(iter(self.keys))
+
+    def rotate(self, keys):
+        """Remplace le jeu de clés; les tokens signés par une clé retirée sont rejetés"""
+        with self._lock:
+            self.keys = OrderedDict(keys)
+            self._cache = OrderedDict(
+                (digest, entry) for digest, entry in self._cache.items()
+                if entry[2] in self.keys
+            )
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def issue(self, claims, ttl=3600):
+        """Signe un token avec la clé active"""
+        kid = self.active_kid
+        header = {'alg': 'HS256', 'typ': 'JWT', 'kid': kid}
+        payload = dict(claims)
+        payload.setdefault('iat', int(time.time()))
+        payload.setdefault('exp', payload['iat'] + ttl)
+        signing_input = '.'.join(
+            _b64encode(json.dumps(part, separators=(',', ':')).encode())
+            for part in (header, payload)
+        )
+        signature = hmac.new(self.keys[kid], signing_input.encode(), hashlib.sha256).digest()
+        return f'{signing_input}.{_b64encode(signature)}'
+
+    def verify(self, token):
+        """Renvoie les claims du token, depuis le cache si possible"""
+        now = time.time()
+        digest = hashlib.sha256(token.encode()).digest()
+
+        with self._lock:
+            entry = self._cache.get(digest)
+            if entry is not None:
+                claims, exp, _ = entry
+                if now < exp + self.leeway:
+                    self._cache.move_to_end(digest)
+                    self.hits += 1
+                    return claims
+                del self._cache[digest]
+            self.misses += 1
+
+        claims, kid = self._verify_signature(token)
+        exp = claims['exp']
+        if now >= exp + self.leeway:
+            raise TokenError('Token expired')
+
+        with self._lock:
+            self._cache[digest] = (claims, exp, kid)
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return claims
+
+    def _verify_signature(self, token):
+        try:
+            header_b64, payload_b64, signature_b64 = token.split('.')
+            header = json.loads(_b64decode(header_b64))
+            signature = _b64decode(signature_b64)
+        except (ValueError, TypeError):
+            raise TokenError('Malformed token')
+
+        if not isinstance(header, dict) or header.get('alg') != 'HS256':
+            raise TokenError('Unsupported algorithm')
+        key = self.keys.get(header.get('kid'))
+        if key is None:
+            raise TokenError('Unknown signing key')
+
+        expected = hmac.new(key, f'{header_b64}.{payload_b64}'.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(signature, expected):
+            raise TokenError('Invalid signature')
+
+        try:
+            claims = json.loads(_b64decode(payload_b64))
+        except (ValueError, TypeError):
+            raise TokenError('Malformed token')
+        if not isinstance(claims, dict) or not isinstance(claims.get('exp'), (int, float)):
+            raise TokenError('Token has no expiry')
+        return claims, header['kid']
+
+
+token_verifier = None
+
+
+def init_auth(app):
+    """Crée le vérificateur de tokens à partir de la configuration de l'app"""
+    global token_verifier
+    keys = parse_signing_keys(app.config.get('AUTH_SIGNING_KEYS'))
+    if not keys:
+        # Pas de repli sur SECRET_KEY: sa valeur par défaut est publique et
+        # permettrait à n'importe qui de signer un token admin
+        raise RuntimeError(
+            'AUTH_SIGNING_KEYS is not set: configure at least one "kid:secret" signing key'
+        )
+    token_verifier = TokenVerifier(
+        keys,
+        cache_size=app.config.get('AUTH_TOKEN_CACHE_SIZE', 1024),
+        leeway=app.config.get('AUTH_TOKEN_LEEWAY', 0)
+    )
+
+    @app.cli.command('issue-token')
+    @click.argument('role')
+    @click.option('--sub', default='cli', help='Subject (user) of the token')
+    @click.option('--ttl', default=3600, help='Lifetime in seconds')
+    def issue_token(role, sub, ttl):
+        """Signe un token Bearer avec la clé active"""
+        click.echo(token_verifier.issue({'sub': sub, 'role': role}, ttl=ttl))
+
+    return token_verifier
+
+
+def get_bearer_token(request):
+    """Extrait le token du header Authorization: Bearer <token>"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
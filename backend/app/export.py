@@ -0,0 +1,292 @@
+"""
+Export en masse des produits et utilisateurs (CSV / NDJSON / Parquet)
+Lecture par curseur côté serveur, par lots de taille fixe: la mémoire
+du worker reste constante quelle que soit la taille de la table.
+"""
+
+from datetime import datetime
+from sqlalchemy import select
+import csv
+import io
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet désactivé si pyarrow n'est pas installé
+    pa = None
+    pq = None
+
+BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+EXPORT_DIR = os.getenv('EXPORT_DIR', '/tmp/exports')
+JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', 24 * 3600))
+MAX_RUNNING_JOBS = int(os.getenv('EXPORT_MAX_RUNNING_JOBS', 2))
+# Les fichiers sont locaux au pod qui a exécuté le job
+HOSTNAME = socket.gethostname()
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Colonnes exportées et leur type Arrow
+RESOURCES = {
+    'products': [
+        ('id', 'int64'),
+        ('name', 'string'),
+        ('description', 'string'),
+        ('price', 'float64'),
+        ('stock', 'int64'),
+        ('created_at', 'timestamp'),
+        ('updated_at', 'timestamp'),
+    ],
+    'users': [
+        ('id', 'int64'),
+        ('username', 'string'),
+        ('email', 'string'),
+        ('created_at', 'timestamp'),
+    ],
+}
+
+# Copie locale des jobs de ce worker (Redis absent ou breaker ouvert)
+_local_jobs = {}
+_jobs_lock = threading.Lock()
+_running_jobs = threading.BoundedSemaphore(MAX_RUNNING_JOBS)
+
+
+class TooManyJobsError(Exception):
+    """Trop d'exports en cours dans ce worker"""
+
+
+class JobStoreUnavailable(Exception):
+    """Redis indisponible: impossible de savoir si le job existe"""
+
+
+def parquet_available():
+    return pa is not None
+
+
+def _table_for(resource):
+    from app.models import Product, User
+    return {'products': Product, 'users': User}[resource].__table__
+
+
+def iter_batches(engine, resource, batch_size=BATCH_SIZE):
+    """Itère sur la table par lots via un curseur serveur (stream_results)"""
+    table = _table_for(resource)
+    columns = [table.c[name] for name, _ in RESOURCES[resource]]
+    stmt = select(*columns).order_by(table.c.id)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=batch_size
+        ).execute(stmt)
+        for partition in result.partitions():
+            yield partition
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _csv_chunks(resource, batches):
+    names = [name for name, _ in RESOURCES[resource]]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for batch in batches:
+        for row in batch:
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(resource, batches):
+    names = [name for name, _ in RESOURCES[resource]]
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(names, row)), default=_json_default) + '\n'
+            for row in batch
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Fichier en écriture seule dont on vide le contenu après chaque lot"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_schema(resource):
+    types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us'),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in RESOURCES[resource]])
+
+
+def _parquet_chunks(resource, batches):
+    """Chaque lot devient un row group Parquet (stockage colonnaire)"""
+    schema = _arrow_schema(resource)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            columns = list(zip(*batch))
+            record_batch = pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            )
+            writer.write_batch(record_batch)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def generate_export(engine, resource, fmt, batch_size=BATCH_SIZE):
+    """Générateur des morceaux de l'export dans le format demandé"""
+    batches = iter_batches(engine, resource, batch_size)
+    if fmt == 'csv':
+        return _csv_chunks(resource, batches)
+    if fmt == 'ndjson':
+        return _ndjson_chunks(resource, batches)
+    return _parquet_chunks(resource, batches)
+
+
+# --- Jobs d'export en arrière-plan ----------------------------------------
+
+def _job_key(job_id):
+    return f'export:job:{job_id}'
+
+
+def save_job(redis_client, job):
+    with _jobs_lock:
+        _local_jobs[job['id']] = job
+    if redis_client:
+        redis_client.setex(_job_key(job['id']), JOB_TTL, json.dumps(job))
+
+
+def get_job(redis_client, job_id):
+    """
+    Renvoie le job ou None s'il n'existe pas.
+    Lève JobStoreUnavailable si Redis est configuré mais injoignable
+    et que le job n'a pas été créé par ce worker.
+    """
+    cleanup_expired_jobs()
+    with _jobs_lock:
+        job = _local_jobs.get(job_id)
+    if job and time.time() - job['created_at'] < JOB_TTL:
+        return job
+    if redis_client is None:
+        return None
+    if not redis_client:
+        raise JobStoreUnavailable('Export job store is unavailable')
+    cached = redis_client.get(_job_key(job_id))
+    return json.loads(cached) if cached else None
+
+
+def cleanup_expired_jobs(now=None):
+    """Supprime les jobs et fichiers d'export plus vieux que JOB_TTL"""
+    now = now or time.time()
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in _local_jobs.items()
+                       if now - job['created_at'] >= JOB_TTL]:
+            del _local_jobs[job_id]
+
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime >= JOB_TTL:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _run_job(app, redis_client, job):
+    with app.app_context():
+        from app import db
+        tmp_path = job['path'] + '.part'
+        try:
+            mode = 'wb' if job['format'] == 'parquet' else 'w'
+            with open(tmp_path, mode) as f:
+                for chunk in generate_export(db.engine, job['resource'], job['format']):
+                    f.write(chunk)
+            os.replace(tmp_path, job['path'])
+            job.update({
+                'status': 'completed',
+                'size': os.path.getsize(job['path']),
+                'finished_at': time.time()
+            })
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            job.update({
+                'status': 'failed',
+                'error': str(e),
+                'finished_at': time.time()
+            })
+        finally:
+            _running_jobs.release()
+        save_job(redis_client, job)
+
+
+def start_export_job(app, redis_client, resource, fmt):
+    """Lance un export vers un fichier local et renvoie le job (à interroger par ID)"""
+    cleanup_expired_jobs()
+    if not _running_jobs.acquire(blocking=False):
+        raise TooManyJobsError(f'At most {MAX_RUNNING_JOBS} exports can run at once')
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'resource': resource,
+            'format': fmt,
+            'status': 'running',
+            'host': HOSTNAME,
+            'path': os.path.join(EXPORT_DIR, f'{resource}-{job_id}.{FORMATS[fmt][1]}'),
+            'created_at': time.time()
+        }
+        save_job(redis_client, job)
+        threading.Thread(
+            target=_run_job,
+            args=(app, redis_client, dict(job)),
+            daemon=True
+        ).start()
+    except Exception:
+        _running_jobs.release()
+        raise
+    return job
@@ -2,7 +2,12 @@
 Middleware de sécurité pour Flask
 """
 
-from flask import request, jsonify
+from flask import Response, g, request, jsonify
+import hashlib
+import json
+import os
+import time
+from app import auth
 from app.security import (
     add_security_headers,
     detect_attack_patterns,
@@ -71,3 +76,137 @@ def init_security_middleware(app):
             "error": "Too many requests",
             "message": "Please slow down"
         }), 429
+
+
+# Idempotency-Key: une même clé ne déclenche le handler qu'une seule fois
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', 60))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', 10))
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# Réponses qui n'ont pas exécuté la requête: la clé est libérée
+IDEMPOTENCY_RETRYABLE = {401, 403, 429}
+
+
+def _client_identity():
+    """
+    Sujet du token vérifié (stable quand le token est renouvelé), sinon
+    le header Authorization brut ou l'IP pour les requêtes sans token valide
+    """
+    token = auth.get_bearer_token(request)
+    if token and auth.token_verifier:
+        try:
+            claims = auth.token_verifier.verify(token)
+        except auth.TokenError:
+            claims = {}
+        if claims.get('sub') is not None:
+            return f"sub:{claims['sub']}"
+    return request.headers.get('Authorization', request.remote_addr or '')
+
+
+def _idempotency_redis_key(key):
+    """Clé Redis scopée par méthode, route et identité du client"""
+    scope = hashlib.sha256(
+        f"{request.method}:{request.path}:{_client_identity()}:{key}".encode()
+    ).hexdigest()
+    return f'idempotency:{scope}'
+
+
+def _request_fingerprint():
+    return hashlib.sha256(request.get_data()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record['body'], status=record['status'], mimetype=record['mimetype'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def init_idempotency_middleware(app):
+    """Rejoue la réponse stockée pour les POST/PUT/DELETE déjà traités"""
+    
+    @app.before_request
+    def idempotency_check():
+        from app import redis_client
+        
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not redis_client or request.method not in ['POST', 'PUT', 'DELETE']:
+            return None
+        if len(key) > 255:
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} is too long"}), 400
+        
+        redis_key = _idempotency_redis_key(key)
+        fingerprint = _request_fingerprint()
+        marker = json.dumps({"state": "in_progress", "fingerprint": fingerprint})
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        
+        # Le proxy Redis renvoie None quand le breaker refuse l'appel ou
+        # qu'il échoue: SET NX puis GET tous deux à None = Redis indisponible
+        retried = False
+        while True:
+            if redis_client.set(redis_key, marker, nx=True, ex=IDEMPOTENCY_LOCK_TTL):
+                g.idempotency_key = redis_key
+                g.idempotency_fingerprint = fingerprint
+                return None
+            
+            stored = redis_client.get(redis_key)
+            if stored is None:
+                # Une seule nouvelle tentative (clé expirée entre SET et GET),
+                # sinon on traite la requête sans idempotence
+                if retried or not redis_client:
+                    log_security_event(
+                        "IDEMPOTENCY_UNAVAILABLE",
+                        f"Redis unavailable, {IDEMPOTENCY_HEADER} ignored on {request.path}",
+                        "WARNING"
+                    )
+                    return None
+                retried = True
+                time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+                continue
+            
+            record = json.loads(stored)
+            if record['fingerprint'] != fingerprint:
+                return jsonify({
+                    "error": f"{IDEMPOTENCY_HEADER} reused with a different request body"
+                }), 422
+            if record['state'] == 'completed':
+                return _replay(record)
+            
+            # Un doublon concurrent est en cours: attendre son résultat
+            if time.monotonic() >= deadline:
+                response = jsonify({"error": "A request with this key is still in progress"})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+    
+    @app.after_request
+    def idempotency_store(response):
+        from app import redis_client
+        
+        redis_key = g.pop('idempotency_key', None)
+        if not redis_key or not redis_client:
+            return response
+        
+        if response.status_code >= 500 or response.status_code in IDEMPOTENCY_RETRYABLE \
+                or response.is_streamed:
+            redis_client.delete(redis_key)
+        else:
+            redis_client.setex(redis_key, IDEMPOTENCY_TTL, json.dumps({
+                "state": "completed",
+                "fingerprint": g.idempotency_fingerprint,
+                "status": response.status_code,
+                "body": response.get_data(as_text=True),
+                "mimetype": response.mimetype
+            }))
+        return response
+    
+    @app.teardown_request
+    def idempotency_release(error):
+        """Libère la clé si le handler a levé une exception non gérée"""
+        from app import redis_client
+        
+        redis_key = g.pop('idempotency_key', None)
+        if redis_key and redis_client:
+            redis_client.delete(redis_key)
@@ -1,4 +1,5 @@
 from app import db
+from app.search import register_search_ddl
 from datetime import datetime
 
 class User(db.Model):
@@ -38,3 +39,6 @@ class Product(db.Model):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+
+# Index plein texte (tsvector/GIN sur Postgres, FTS5 sur SQLite)
+register_search_ddl(Product.__table__)
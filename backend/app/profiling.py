@@ -0,0 +1,325 @@
+"""
+Diagnostics à la demande du worker courant
+- Profil CPU par échantillonnage (piles "collapsed" pour flamegraph.pl / speedscope)
+- Snapshots et diffs tracemalloc des principaux sites d'allocation
+- Allocations par route
+
+L'état est propre à chaque process (gunicorn: plusieurs workers par pod,
+plusieurs pods): chaque réponse indique le worker (host, pid) qui l'a
+servie, et les résultats sont publiés dans Redis et dans un fichier local
+au pod pour être relus depuis n'importe quel worker.
+
+Rien n'est actif par défaut: sans profil ni tracemalloc en cours, le
+seul coût est un test de booléen par requête.
+"""
+
+from collections import Counter, defaultdict
+from flask import g, request
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+MAX_PROFILE_SECONDS = 60
+MIN_SAMPLE_INTERVAL = 0.001
+
+HOSTNAME = socket.gethostname()
+RESULT_TTL = int(os.getenv('PROFILING_RESULT_TTL', 3600))
+RESULT_DIR = os.getenv('PROFILING_RESULT_DIR', '/tmp/profiling')
+# Publication des compteurs par route au plus toutes les N secondes
+ROUTES_PUBLISH_INTERVAL = 5
+
+# Fonctions Python qui bloquent dans du C (sommeil, I/O, verrous): un
+# thread dont la pile se termine ici attend et ne consomme pas de CPU
+_IDLE_LEAVES = frozenset({
+    'accept', 'acquire', 'poll', 'readinto', 'recv', 'recv_into',
+    'select', 'sleep', 'wait', 'wait_for', '_wait_for_tstate_lock',
+})
+
+_profile_lock = threading.Lock()
+_profile_state = {
+    'running': False,
+    'started_at': None,
+    'seconds': 0,
+    'idle_samples': 0,
+    'result': None,
+}
+_memory_state = {
+    'baseline': None,
+    'track_routes': False,
+    'routes_published_at': 0.0,
+}
+_route_allocations = defaultdict(lambda: {"requests": 0, "net_blocks": 0, "net_bytes": 0})
+
+
+class ProfilerBusyError(Exception):
+    """Un profil CPU est déjà en cours dans ce worker"""
+
+
+class ResultStoreUnavailable(Exception):
+    """Redis indisponible: impossible de lire le résultat d'un autre pod"""
+
+
+def worker_info():
+    """Identité du worker courant (le pid change à chaque fork gunicorn)"""
+    return {'host': HOSTNAME, 'pid': os.getpid()}
+
+
+def is_current_worker(host, pid):
+    return host == HOSTNAME and pid == os.getpid()
+
+
+# --- Résultats partagés entre workers -------------------------------------
+
+def _result_key(kind, host, pid):
+    return f'debug:{host}:{pid}:{kind}'
+
+
+def _result_path(kind, pid):
+    return os.path.join(RESULT_DIR, f'{pid}-{kind}.json')
+
+
+def publish_result(redis_client, kind, data):
+    """
+    Publie le dernier résultat `kind` de ce worker: fichier local (lisible
+    par les autres workers du pod) et Redis (lisible depuis les autres pods)
+    """
+    worker = worker_info()
+    record = json.dumps({'worker': worker, 'published_at': time.time(), 'data': data})
+    path = _result_path(kind, worker['pid'])
+    try:
+        os.makedirs(RESULT_DIR, exist_ok=True)
+        with open(path + '.part', 'w') as f:
+            f.write(record)
+        os.replace(path + '.part', path)
+    except OSError as e:
+        print(f"⚠️  Could not write {kind} result: {e}")
+    if redis_client:
+        redis_client.setex(_result_key(kind, worker['host'], worker['pid']), RESULT_TTL, record)
+
+
+def load_result(redis_client, kind, host, pid):
+    """
+    Renvoie le dernier résultat publié par le worker (host, pid), ou None.
+    Lève ResultStoreUnavailable si le worker est sur un autre pod et que
+    Redis est configuré mais injoignable.
+    """
+    if host == HOSTNAME:
+        try:
+            with open(_result_path(kind, pid)) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            record = None
+    elif redis_client is None:
+        return None
+    elif not redis_client:
+        raise ResultStoreUnavailable('Diagnostics result store is unavailable')
+    else:
+        cached = redis_client.get(_result_key(kind, host, pid))
+        record = json.loads(cached) if cached else None
+    if record and time.time() - record['published_at'] >= RESULT_TTL:
+        return None
+    return record
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})"
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _sample(seconds, interval, redis_client):
+    own_thread = threading.get_ident()
+    stacks = Counter()
+    idle = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            if frame.f_code.co_name in _IDLE_LEAVES:
+                idle += 1
+            else:
+                stacks[_collapse(frame)] += 1
+        time.sleep(interval)
+
+    result = '\n'.join(f'{stack} {count}' for stack, count in stacks.most_common())
+    with _profile_lock:
+        _profile_state['result'] = result
+        _profile_state['idle_samples'] = idle
+        _profile_state['running'] = False
+    publish_result(redis_client, 'cpu_profile', result)
+
+
+def start_cpu_profile(seconds, interval=0.01, redis_client=None):
+    """
+    Lance un thread qui échantillonne les piles de tous les threads du
+    worker pendant `seconds` (la requête qui le lance n'attend pas: avec
+    des workers synchrones, elle bloquerait le worker profilé).
+
+    Profil CPU et non wall-clock: les piles qui se terminent par un appel
+    bloquant (_IDLE_LEAVES) sont comptées à part dans idle_samples. Un
+    appel C bloquant fait directement depuis le code applicatif reste
+    compté, faute de frame Python pour le reconnaître.
+    """
+    with _profile_lock:
+        if _profile_state['running']:
+            raise ProfilerBusyError('A CPU profile is already running')
+        seconds = min(max(seconds, 0), MAX_PROFILE_SECONDS)
+        _profile_state.update({
+            'running': True,
+            'started_at': time.time(),
+            'seconds': seconds,
+            'idle_samples': 0,
+            'result': None,
+        })
+    threading.Thread(
+        target=_sample,
+        args=(seconds, max(interval, MIN_SAMPLE_INTERVAL), redis_client),
+        name='cpu-profiler',
+        daemon=True
+    ).start()
+    return cpu_profile_status()
+
+
+def cpu_profile_status():
+    with _profile_lock:
+        return {
+            'running': _profile_state['running'],
+            'started_at': _profile_state['started_at'],
+            'seconds': _profile_state['seconds'],
+            'idle_samples': _profile_state['idle_samples'],
+            'ready': _profile_state['result'] is not None,
+        }
+
+
+def cpu_profile_result():
+    """Piles au format collapsed ("frame;frame;frame count" par ligne), ou None"""
+    with _profile_lock:
+        return _profile_state['result']
+
+
+# --- tracemalloc ----------------------------------------------------------
+
+def memory_tracking_status():
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'tracing': tracemalloc.is_tracing(),
+        'frames': tracemalloc.get_traceback_limit(),
+        'track_routes': _memory_state['track_routes'],
+        'traced_bytes': current,
+        'peak_bytes': peak,
+        'has_baseline': _memory_state['baseline'] is not None,
+    }
+
+
+def start_memory_tracking(frames=1, track_routes=False):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _memory_state['track_routes'] = track_routes
+    if track_routes:
+        _route_allocations.clear()
+    return memory_tracking_status()
+
+
+def stop_memory_tracking():
+    _memory_state['track_routes'] = False
+    _memory_state['baseline'] = None
+    tracemalloc.stop()
+    return memory_tracking_status()
+
+
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+
+
+def _format_stat(stat, **fields):
+    # Frames triées de la plus ancienne à la plus récente
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    entry = {'site': frames[-1], 'size_bytes': stat.size, 'count': stat.count, **fields}
+    if len(frames) > 1:
+        entry['traceback'] = frames
+    return entry
+
+
+def take_memory_snapshot(limit=20, key_type='lineno', redis_client=None):
+    """Prend un snapshot, le garde comme référence des diffs, renvoie les top sites"""
+    snapshot = _take_snapshot()
+    _memory_state['baseline'] = snapshot
+    top = [_format_stat(stat) for stat in snapshot.statistics(key_type)[:limit]]
+    publish_result(redis_client, 'memory_snapshot', top)
+    return top
+
+
+def diff_memory_snapshot(limit=20, key_type='lineno', redis_client=None):
+    """Compare l'état actuel au dernier snapshot de référence"""
+    baseline = _memory_state['baseline']
+    if baseline is None:
+        return None
+    stats = _take_snapshot().compare_to(baseline, key_type)
+    diff = [
+        _format_stat(stat, size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+        for stat in stats[:limit]
+    ]
+    publish_result(redis_client, 'memory_diff', diff)
+    return diff
+
+
+def route_allocations(redis_client=None):
+    routes = dict(_route_allocations)
+    publish_result(redis_client, 'route_allocations', routes)
+    _memory_state['routes_published_at'] = time.monotonic()
+    return routes
+
+
+def init_profiling(app):
+    """
+    Compte les allocations nettes (blocs et octets tracés) par route quand
+    le suivi est activé. Les compteurs sont globaux au process: précis avec
+    des workers synchrones (une requête à la fois), approximatifs sinon.
+    Les réponses /api/debug/ portent les headers X-Worker-Host / X-Worker-Pid.
+    """
+
+    @app.before_request
+    def allocation_start():
+        if not _memory_state['track_routes']:
+            return
+        g.alloc_start = (sys.getallocatedblocks(), tracemalloc.get_traced_memory()[0])
+
+    @app.teardown_request
+    def allocation_end(error):
+        start = g.pop('alloc_start', None)
+        if start is None:
+            return
+        route = request.url_rule.rule if request.url_rule else request.path
+        stats = _route_allocations[f"{request.method} {route}"]
+        stats['requests'] += 1
+        stats['net_blocks'] += sys.getallocatedblocks() - start[0]
+        stats['net_bytes'] += tracemalloc.get_traced_memory()[0] - start[1]
+        
+        # Rend les compteurs de ce worker lisibles depuis les autres
+        if time.monotonic() - _memory_state['routes_published_at'] >= ROUTES_PUBLISH_INTERVAL:
+            from app import redis_client
+            route_allocations(redis_client)
+    
+    @app.after_request
+    def worker_headers(response):
+        if request.path.startswith('/api/debug/'):
+            worker = worker_info()
+            response.headers['X-Worker-Host'] = worker['host']
+            response.headers['X-Worker-Pid'] = str(worker['pid'])
+        return response
@@ -0,0 +1,290 @@
+"""
+Circuit breakers pour Redis et PostgreSQL
+- closed: les appels passent, les échecs sont comptés sur une fenêtre glissante
+- open: les appels sont refusés immédiatement pendant open_timeout secondes
+- half_open: quelques appels de test décident de la réouverture ou de la fermeture
+"""
+
+from collections import deque
+from flask import g, jsonify, request
+from prometheus_client import Counter, Gauge
+from sqlalchemy import event
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+import math
+import os
+import threading
+import time
+import redis
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Valeur (vraie) renvoyée par allow_request quand l'appel consomme un essai half_open
+PROBE = 'probe'
+
+breaker_state = Gauge(
+    'circuit_breaker_state',
+    'Circuit breaker state (0=closed, 1=half_open, 2=open)',
+    ['dependency']
+)
+breaker_rejections = Counter(
+    'circuit_breaker_rejections_total',
+    'Calls rejected by an open circuit breaker',
+    ['dependency']
+)
+breaker_failures = Counter(
+    'circuit_breaker_failures_total',
+    'Failed calls recorded by a circuit breaker',
+    ['dependency']
+)
+
+
+class CircuitBreaker:
+    """Circuit breaker basé sur le taux d'échec des derniers appels"""
+
+    def __init__(self, name, failure_rate=0.5, window_size=20, min_calls=5,
+                 open_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+        breaker_state.labels(dependency=name).set(_STATE_VALUES[CLOSED])
+
+    def _set_state(self, state):
+        self._state = state
+        self._outcomes.clear()
+        self._half_open_calls = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        breaker_state.labels(dependency=self.name).set(_STATE_VALUES[state])
+
+    def _refresh(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_timeout:
+            self._set_state(HALF_OPEN)
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def retry_after(self):
+        """Secondes avant le prochain essai (pour le header Retry-After)"""
+        with self._lock:
+            remaining = self.open_timeout - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def allow_request(self):
+        """
+        Indique si un appel peut être tenté: True (fermé), PROBE si l'appel
+        consomme un essai half_open (à rendre par release() s'il n'aboutit
+        ni à un succès ni à un échec), False s'il est refusé.
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return PROBE
+        breaker_rejections.labels(dependency=self.name).inc()
+        return False
+
+    def release(self):
+        """Rend un essai half_open qui s'est terminé sans succès ni échec"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._set_state(CLOSED)
+            elif self._state == CLOSED:
+                self._outcomes.append(True)
+
+    def record_failure(self):
+        breaker_failures.labels(dependency=self.name).inc()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._set_state(OPEN)
+                return
+            if self._state != CLOSED:
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and \
+                    failures / len(self._outcomes) >= self.failure_rate:
+                self._set_state(OPEN)
+
+    def reset(self):
+        """Remet le breaker à l'état fermé"""
+        with self._lock:
+            self._set_state(CLOSED)
+
+
+def breaker_from_env(name, prefix):
+    """Construit un breaker configuré par variables d'environnement"""
+    return CircuitBreaker(
+        name,
+        failure_rate=float(os.getenv(f'{prefix}_BREAKER_FAILURE_RATE', 0.5)),
+        window_size=int(os.getenv(f'{prefix}_BREAKER_WINDOW', 20)),
+        min_calls=int(os.getenv(f'{prefix}_BREAKER_MIN_CALLS', 5)),
+        open_timeout=float(os.getenv(f'{prefix}_BREAKER_OPEN_TIMEOUT', 30)),
+    )
+
+
+# --- Redis ----------------------------------------------------------------
+
+class _GuardedPipeline:
+    """Pipeline dont seul execute() (le seul appel réseau) passe par le breaker"""
+
+    def __init__(self, pipeline, client):
+        self._pipeline = pipeline
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def execute(self):
+        return self._client._call(self._pipeline.execute)
+
+
+class BreakerRedis:
+    """
+    Proxy du client Redis protégé par un circuit breaker.
+    Évalué comme faux quand le breaker est ouvert: les "if redis_client:"
+    existants sautent alors le cache sans attendre de timeout.
+    Une erreur Redis est traitée comme un cache miss (None).
+    """
+
+    def __init__(self, client, breaker):
+        self._client = client
+        self.breaker = breaker
+
+    def __bool__(self):
+        return self.breaker.state != OPEN
+
+    def _call(self, func, *args, **kwargs):
+        if not self.breaker.allow_request():
+            return None
+        recorded = False
+        try:
+            result = func(*args, **kwargs)
+            self.breaker.record_success()
+            recorded = True
+            return result
+        except redis.RedisError as e:
+            self.breaker.record_failure()
+            recorded = True
+            print(f"⚠️  Redis call failed: {e}")
+            return None
+        finally:
+            # Autre exception (ex: UnicodeDecodeError): ni succès ni échec
+            # de disponibilité, mais l'essai half_open doit être rendu
+            if not recorded:
+                self.breaker.release()
+
+    def pipeline(self, *args, **kwargs):
+        return _GuardedPipeline(self._client.pipeline(*args, **kwargs), self)
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self._call(attr, *args, **kwargs)
+        return guarded
+
+
+# --- PostgreSQL -----------------------------------------------------------
+
+# Routes qui font leur propre vérification de la base
+_DB_GATE_EXEMPT = ('/api/health', '/api/ready')
+# Diagnostics: n'utilisent pas la base et servent justement pendant un incident
+_DB_GATE_EXEMPT_PREFIXES = ('/api/debug/',)
+
+
+def db_engine_options(database_url):
+    """Délais de connexion et d'exécution par appel (Postgres uniquement)"""
+    if not database_url.startswith('postgresql'):
+        return {}
+    return {
+        'pool_pre_ping': True,
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        'connect_args': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 3)),
+            'options': f"-c statement_timeout={int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 5000))}"
+        }
+    }
+
+
+def _is_availability_error(error):
+    """Erreurs de disponibilité (et non de requête/contrainte)"""
+    return isinstance(error, (OperationalError, DisconnectionError)) or \
+        getattr(error, 'connection_invalidated', False)
+
+
+def _unavailable_response(breaker):
+    response = jsonify({
+        "error": "Service temporarily unavailable",
+        "dependency": breaker.name
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(breaker.retry_after())
+    return response
+
+
+def init_db_circuit_breaker(app, db, breaker):
+    """Branche le breaker sur le moteur SQLAlchemy et rejette les requêtes quand il est ouvert"""
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _record_success(conn, cursor, statement, parameters, context, executemany):
+        breaker.record_success()
+
+    @event.listens_for(engine, 'handle_error')
+    def _record_failure(context):
+        if context.is_disconnect or _is_availability_error(context.sqlalchemy_exception):
+            breaker.record_failure()
+
+    @app.before_request
+    def db_fast_fail():
+        if not request.path.startswith('/api/') or request.path in _DB_GATE_EXEMPT \
+                or request.path.startswith(_DB_GATE_EXEMPT_PREFIXES):
+            return None
+        allowed = breaker.allow_request()
+        if not allowed:
+            return _unavailable_response(breaker)
+        # Seule la requête qui détient l'essai half_open peut le rendre
+        g.db_probe = allowed == PROBE
+        return None
+
+    @app.teardown_request
+    def db_release_probe(error):
+        # Requête d'essai servie sans toucher la base (ex: cache Redis)
+        if g.pop('db_probe', False):
+            breaker.release()
+
+    @app.errorhandler(OperationalError)
+    @app.errorhandler(DisconnectionError)
+    @app.errorhandler(PoolTimeoutError)
+    def db_unavailable(error):
+        # Le pool saturé ne passe pas par handle_error
+        if isinstance(error, PoolTimeoutError):
+            breaker.record_failure()
+        db.session.rollback()
+        return _unavailable_response(breaker)
@@ -1,7 +1,30 @@
-from flask import Blueprint, jsonify, request
-from app import db, redis_client
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+from app import db, db_breaker, redis_client, redis_breaker
 from app.models import User, Product
+from app.security import require_role
+from app import profiling
+from app.export import (
+    FORMATS,
+    HOSTNAME,
+    RESOURCES,
+    JobStoreUnavailable,
+    TooManyJobsError,
+    generate_export,
+    get_job,
+    parquet_available,
+    start_export_job
+)
+from app.search import (
+    MAX_PER_PAGE,
+    MAX_SEARCH_OFFSET,
+    cache_results,
+    get_cached_results,
+    invalidate_search_cache,
+    search_products as run_product_search,
+    tokenize
+)
 import json
+import os
 import time
 
 api_bp = Blueprint('api', __name__)
@@ -25,6 +48,10 @@ def health_check():
         'timestamp': time.time(),
         'database': db_status,
         'redis': redis_status,
+        'circuit_breakers': {
+            'database': db_breaker.state,
+            'redis': redis_breaker.state
+        },
         'version': '1.0.0'
     }), 200
 
@@ -87,6 +114,7 @@ def get_user(user_id):
     return jsonify(user_data), 200
 
 @api_bp.route('/users', methods=['POST'])
+@require_role('admin')
 def create_user():
     """Create a new user"""
     data = request.get_json()
@@ -117,6 +145,7 @@ def create_user():
     return jsonify(user.to_dict()), 201
 
 @api_bp.route('/users/<int:user_id>', methods=['DELETE'])
+@require_role('admin')
 def delete_user(user_id):
     """Delete a user"""
     user = User.query.get_or_404(user_id)
@@ -155,6 +184,43 @@ def get_products():
         'cached': False
     }), 200
 
+@api_bp.route('/products/search', methods=['GET'])
+def search_products():
+    """Full-text search over product name and description"""
+    tokens = tokenize(request.args.get('q', ''))
+    if not tokens:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    if not current_app.config.get('SEARCH_INDEX_READY'):
+        return jsonify({'error': 'Search index is not available yet'}), 503
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+    if (page - 1) * per_page > MAX_SEARCH_OFFSET:
+        return jsonify({'error': f'Results are limited to the first {MAX_SEARCH_OFFSET}'}), 400
+    
+    cache_key, cached = get_cached_results(redis_client, tokens, page, per_page)
+    if cached:
+        return jsonify({**cached, 'cached': True}), 200
+    
+    ranked, total = run_product_search(db.session, tokens, page, per_page)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_([pid for pid, _ in ranked]))}
+    results = [
+        {**products[pid].to_dict(), 'rank': rank}
+        for pid, rank in ranked if pid in products
+    ]
+    payload = {
+        'products': results,
+        'query': ' '.join(tokens),
+        'page': page,
+        'per_page': per_page,
+        'total': total
+    }
+    
+    cache_results(redis_client, cache_key, payload)
+    
+    return jsonify({**payload, 'cached': False}), 200
+
 @api_bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """Get a specific product"""
@@ -174,6 +240,7 @@ def get_product(product_id):
     return jsonify(product_data), 200
 
 @api_bp.route('/products', methods=['POST'])
+@require_role('editor')
 def create_product():
     """Create a new product"""
     data = request.get_json()
@@ -194,10 +261,12 @@ def create_product():
     
     if redis_client:
         redis_client.delete('products:all')
+    invalidate_search_cache(redis_client)
     
     return jsonify(product.to_dict()), 201
 
 @api_bp.route('/products/<int:product_id>', methods=['PUT'])
+@require_role('editor')
 def update_product(product_id):
     """Update a product"""
     product = Product.query.get_or_404(product_id)
@@ -217,10 +286,12 @@ def update_product(product_id):
     if redis_client:
         redis_client.delete('products:all')
         redis_client.delete(f'product:{product_id}')
+    invalidate_search_cache(redis_client)
     
     return jsonify(product.to_dict()), 200
 
 @api_bp.route('/products/<int:product_id>', methods=['DELETE'])
+@require_role('editor')
 def delete_product(product_id):
     """Delete a product"""
     product = Product.query.get_or_404(product_id)
@@ -230,9 +301,102 @@ def delete_product(product_id):
     if redis_client:
         redis_client.delete('products:all')
         redis_client.delete(f'product:{product_id}')
+    invalidate_search_cache(redis_client)
     
     return jsonify({'message': 'Product deleted successfully'}), 200
 
+# Export endpoints
+def _validate_export(resource, fmt):
+    """Return an error response for an unsupported export, or None"""
+    if resource not in RESOURCES:
+        return jsonify({'error': f'Unknown resource: {resource}'}), 404
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Format must be one of: {', '.join(FORMATS)}"}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'error': 'Parquet export requires pyarrow'}), 501
+    return None
+
+def _public_job(job):
+    return {key: value for key, value in job.items() if key != 'path'}
+
+@api_bp.route('/export/<resource>', methods=['GET'])
+@require_role('admin')
+def export_resource(resource):
+    """Stream a full export of products or users"""
+    fmt = request.args.get('format', 'csv')
+    error = _validate_export(resource, fmt)
+    if error:
+        return error
+    
+    mimetype, extension = FORMATS[fmt]
+    chunks = generate_export(db.engine, resource, fmt)
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={resource}.{extension}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@api_bp.route('/export/jobs', methods=['POST'])
+@require_role('admin')
+def create_export_job():
+    """Run a large export in the background, to be polled by job ID"""
+    data = request.get_json() or {}
+    resource = data.get('resource', '')
+    fmt = data.get('format', 'csv')
+    error = _validate_export(resource, fmt)
+    if error:
+        return error
+    
+    try:
+        job = start_export_job(current_app._get_current_object(), redis_client, resource, fmt)
+    except TooManyJobsError as e:
+        return jsonify({'error': str(e)}), 429
+    
+    return jsonify(_public_job(job)), 202
+
+@api_bp.route('/export/jobs/<job_id>', methods=['GET'])
+@require_role('admin')
+def get_export_job(job_id):
+    """Get the status of a background export"""
+    try:
+        job = get_job(redis_client, job_id)
+    except JobStoreUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(redis_breaker.retry_after())}
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    return jsonify(_public_job(job)), 200
+
+@api_bp.route('/export/jobs/<job_id>/download', methods=['GET'])
+@require_role('admin')
+def download_export_job(job_id):
+    """Download the file produced by a completed export"""
+    try:
+        job = get_job(redis_client, job_id)
+    except JobStoreUnavailable as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(redis_breaker.retry_after())}
+    if not job:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'error': 'Export not ready', 'status': job['status']}), 409
+    if not os.path.exists(job['path']):
+        if job.get('host') != HOSTNAME:
+            # Le fichier est sur le disque d'un autre pod
+            return jsonify({
+                'error': 'Export file is stored on another instance',
+                'host': job.get('host')
+            }), 409
+        return jsonify({'error': 'Export file no longer available'}), 404
+    
+    return send_file(
+        job['path'],
+        mimetype=FORMATS[job['format']][0],
+        as_attachment=True,
+        download_name=f"{job['resource']}.{FORMATS[job['format']][1]}"
+    )
+
 # Stats endpoint
 @api_bp.route('/stats', methods=['GET'])
 def get_stats():
@@ -245,3 +409,174 @@ def get_stats():
         'products': product_count,
         'timestamp': time.time()
     }), 200
+
+# Diagnostics endpoints (admin only, per worker)
+def _debug_json(payload, status=200, worker=None):
+    """Réponse JSON des diagnostics, avec le worker dont elle décrit l'état"""
+    return jsonify({**payload, 'worker': worker or profiling.worker_info()}), status
+
+def _requested_worker():
+    """
+    Worker demandé par ?host=&pid= (host par défaut: ce pod).
+    Renvoie ((host, pid) ou None pour le worker courant, réponse d'erreur ou None)
+    """
+    if 'pid' not in request.args and 'host' not in request.args:
+        return None, None
+    pid = request.args.get('pid', type=int)
+    if pid is None:
+        return None, _debug_json({'error': 'pid must be an integer'}, 400)
+    host = request.args.get('host', profiling.HOSTNAME)
+    if profiling.is_current_worker(host, pid):
+        return None, None
+    return (host, pid), None
+
+def _published_result(kind, worker):
+    """Dernier résultat publié par un autre worker: (record, None) ou (None, réponse d'erreur)"""
+    host, pid = worker
+    try:
+        record = profiling.load_result(redis_client, kind, host, pid)
+    except profiling.ResultStoreUnavailable as e:
+        return None, _debug_json({'error': str(e)}, 503)
+    if record is None:
+        return None, _debug_json({
+            'error': f'No {kind} published by this worker',
+            'requested': {'host': host, 'pid': pid}
+        }, 404)
+    return record, None
+
+def _key_type_and_limit():
+    key_type = request.args.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return None, None, _debug_json(
+            {'error': 'key_type must be lineno, filename or traceback'}, 400
+        )
+    return key_type, request.args.get('limit', 20, type=int), None
+
+@api_bp.route('/debug/profile/cpu', methods=['POST'])
+@require_role('admin')
+def start_cpu_profile():
+    """Start a time-bounded sampling CPU profile of the worker serving this request"""
+    data = request.get_json() or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval = float(data.get('interval', 0.01))
+    except (TypeError, ValueError):
+        return _debug_json({'error': 'seconds and interval must be numbers'}, 400)
+    
+    try:
+        status = profiling.start_cpu_profile(seconds, interval, redis_client)
+    except profiling.ProfilerBusyError as e:
+        return _debug_json({'error': str(e)}, 409)
+    
+    return _debug_json(status, 202)
+
+@api_bp.route('/debug/profile/cpu', methods=['GET'])
+@require_role('admin')
+def get_cpu_profile():
+    """Get the last CPU profile as flamegraph collapsed stacks (?host=&pid= for another worker)"""
+    worker, error = _requested_worker()
+    if error:
+        return error
+    if worker:
+        record, error = _published_result('cpu_profile', worker)
+        if error:
+            return error
+        collapsed = record['data']
+    else:
+        collapsed = profiling.cpu_profile_result()
+        if collapsed is None:
+            return _debug_json(profiling.cpu_profile_status(), 409)
+    
+    return Response(collapsed, mimetype='text/plain'), 200
+
+@api_bp.route('/debug/memory', methods=['GET'])
+@require_role('admin')
+def memory_status():
+    """Get tracemalloc status"""
+    return _debug_json(profiling.memory_tracking_status())
+
+@api_bp.route('/debug/memory/start', methods=['POST'])
+@require_role('admin')
+def start_memory_tracking():
+    """Start tracemalloc, optionally with per-route allocation counts"""
+    data = request.get_json() or {}
+    try:
+        frames = min(max(int(data.get('frames', 1)), 1), 50)
+    except (TypeError, ValueError):
+        return _debug_json({'error': 'frames must be an integer'}, 400)
+    status = profiling.start_memory_tracking(frames, bool(data.get('track_routes', False)))
+    return _debug_json(status)
+
+@api_bp.route('/debug/memory/stop', methods=['POST'])
+@require_role('admin')
+def stop_memory_tracking():
+    """Stop tracemalloc and drop the baseline snapshot"""
+    return _debug_json(profiling.stop_memory_tracking())
+
+@api_bp.route('/debug/memory/snapshot', methods=['POST'])
+@require_role('admin')
+def memory_snapshot():
+    """Take a snapshot (new diff baseline) and return the top allocation sites"""
+    if not profiling.memory_tracking_status()['tracing']:
+        return _debug_json({'error': 'Memory tracking is not started'}, 409)
+    
+    key_type, limit, error = _key_type_and_limit()
+    if error:
+        return error
+    
+    return _debug_json({'top': profiling.take_memory_snapshot(limit, key_type, redis_client)})
+
+@api_bp.route('/debug/memory/snapshot', methods=['GET'])
+@require_role('admin')
+def get_memory_snapshot():
+    """Get the last snapshot taken by a worker (?host=&pid=, default: this one)"""
+    worker, error = _requested_worker()
+    if error:
+        return error
+    record, error = _published_result('memory_snapshot', worker or (profiling.HOSTNAME, os.getpid()))
+    if error:
+        return error
+    return _debug_json({'top': record['data'], 'published_at': record['published_at']},
+                       worker=record['worker'])
+
+@api_bp.route('/debug/memory/diff', methods=['GET'])
+@require_role('admin')
+def memory_diff():
+    """Compare current allocations with the last snapshot (?host=&pid=: last published diff)"""
+    worker, error = _requested_worker()
+    if error:
+        return error
+    if worker:
+        record, error = _published_result('memory_diff', worker)
+        if error:
+            return error
+        return _debug_json({'diff': record['data'], 'published_at': record['published_at']},
+                           worker=record['worker'])
+    
+    if not profiling.memory_tracking_status()['tracing']:
+        return _debug_json({'error': 'Memory tracking is not started'}, 409)
+    
+    key_type, limit, error = _key_type_and_limit()
+    if error:
+        return error
+    
+    diff = profiling.diff_memory_snapshot(limit, key_type, redis_client)
+    if diff is None:
+        return _debug_json({'error': 'Take a snapshot first'}, 409)
+    
+    return _debug_json({'diff': diff})
+
+@api_bp.route('/debug/memory/routes', methods=['GET'])
+@require_role('admin')
+def memory_routes():
+    """Get net allocations per route since tracking started (?host=&pid= for another worker)"""
+    worker, error = _requested_worker()
+    if error:
+        return error
+    if worker:
+        record, error = _published_result('route_allocations', worker)
+        if error:
+            return error
+        return _debug_json({'routes': record['data'], 'published_at': record['published_at']},
+                           worker=record['worker'])
+    return _debug_json({'routes': profiling.route_allocations(redis_client)})
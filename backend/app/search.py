@@ -0,0 +1,268 @@
+"""
+Recherche plein texte sur les produits
+PostgreSQL: colonne tsvector générée + index GIN
+SQLite (tests): table virtuelle FTS5 synchronisée par triggers
+"""
+
+from sqlalchemy import DDL, event, text
+import click
+import hashlib
+import json
+import re
+
+# Les requêtes populaires (vues au moins POPULAR_THRESHOLD fois
+# pendant POPULAR_WINDOW secondes) ont leur propre cache de résultats
+POPULAR_THRESHOLD = 3
+POPULAR_WINDOW = 600
+RESULT_CACHE_TTL = 120
+SEARCH_VERSION_KEY = 'products:search:version'
+
+MAX_PER_PAGE = 100
+# Au-delà, la pagination profonde n'a pas de sens (et déborde les entiers SQL)
+MAX_SEARCH_OFFSET = 10000
+MAX_QUERY_LENGTH = 200
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# --- PostgreSQL -----------------------------------------------------------
+# La colonne est GENERATED ... STORED: Postgres la recalcule lui-même à
+# chaque INSERT/UPDATE, sans trigger ni code applicatif.
+_PG_DDL = [
+    """
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_products_search_vector "
+    "ON products USING GIN (search_vector)",
+]
+
+_PG_SEARCH = """
+    SELECT p.id, ts_rank_cd(p.search_vector, query) AS rank,
+           count(*) OVER () AS total
+    FROM products p, to_tsquery('simple', :query) query
+    WHERE p.search_vector @@ query
+    ORDER BY rank DESC, p.id
+    LIMIT :limit OFFSET :offset
+"""
+
+# --- SQLite / FTS5 --------------------------------------------------------
+_SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, content='products', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, coalesce(old.description, ''));
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, coalesce(new.description, ''));
+    END
+    """,
+]
+
+_SQLITE_DROP = "DROP TABLE IF EXISTS products_fts"
+
+# Indexe les lignes déjà présentes quand la table FTS est ajoutée après coup
+_SQLITE_REBUILD = "INSERT INTO products_fts(products_fts) VALUES ('rebuild')"
+
+# Sérialise les migrations lancées en parallèle (plusieurs pods)
+_PG_MIGRATION_LOCK = "SELECT pg_advisory_xact_lock(hashtext('products_search_vector'))"
+
+_PG_CATALOG_CHECK = """
+    SELECT (SELECT count(*) FROM information_schema.columns
+            WHERE table_name = 'products' AND column_name = 'search_vector')
+         + (SELECT count(*) FROM pg_indexes
+            WHERE tablename = 'products' AND indexname = 'idx_products_search_vector')
+"""
+_SQLITE_CATALOG_CHECK = (
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+)
+
+# bm25() renvoie un score négatif: plus petit = plus pertinent.
+# Poids 10 sur name, 1 sur description (équivalent des poids A/B).
+# bm25() ne peut pas cohabiter avec une fonction fenêtre: sous-requête.
+_SQLITE_SEARCH = """
+    SELECT id, rank, count(*) OVER () AS total
+    FROM (
+        SELECT rowid AS id, -bm25(products_fts, 10.0, 1.0) AS rank
+        FROM products_fts
+        WHERE products_fts MATCH :query
+    )
+    ORDER BY rank DESC, id
+    LIMIT :limit OFFSET :offset
+"""
+
+# Total indépendant de LIMIT/OFFSET, pour une page au-delà de la dernière
+_PG_COUNT = """
+    SELECT count(*) FROM products
+    WHERE search_vector @@ to_tsquery('simple', :query)
+"""
+_SQLITE_COUNT = "SELECT count(*) FROM products_fts WHERE products_fts MATCH :query"
+
+
+def register_search_ddl(table):
+    """Attache la création de l'index plein texte au cycle create_all/drop_all"""
+    for statement in _PG_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+    for statement in _SQLITE_DDL:
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(table, 'before_drop', DDL(_SQLITE_DROP).execute_if(dialect='sqlite'))
+
+
+def search_index_ready(engine):
+    """Vérifie (lecture du catalogue uniquement) que l'index plein texte existe"""
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            return conn.execute(text(_PG_CATALOG_CHECK)).scalar() == 2
+        if conn.dialect.name == 'sqlite':
+            return conn.execute(text(_SQLITE_CATALOG_CHECK)).first() is not None
+    return False
+
+
+def ensure_search_index(engine):
+    """
+    Ajoute l'index plein texte à une table products déjà existante.
+    create_all() ignore les tables existantes, donc after_create ne
+    suffit pas pour les déploiements antérieurs à la recherche.
+
+    Sur Postgres, l'ajout de la colonne réécrit la table et la création
+    de l'index la verrouille: à lancer via "flask migrate-search" (job
+    d'init), jamais au démarrage des workers.
+    """
+    if search_index_ready(engine):
+        return False
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Pas de statement_timeout (5s par défaut) pour la migration
+            conn.execute(text("SET LOCAL statement_timeout = 0"))
+            conn.execute(text(_PG_MIGRATION_LOCK))
+            for statement in _PG_DDL:
+                conn.execute(text(statement))
+        elif conn.dialect.name == 'sqlite':
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+            conn.execute(text(_SQLITE_REBUILD))
+    return True
+
+
+def init_search(app, db):
+    """
+    Au démarrage: crée l'index FTS5 sur SQLite (rapide), vérifie seulement
+    sa présence sur Postgres. Enregistre la commande "flask migrate-search".
+    """
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            ensure_search_index(db.engine)
+        app.config['SEARCH_INDEX_READY'] = search_index_ready(db.engine)
+    if not app.config['SEARCH_INDEX_READY']:
+        print("⚠️  Full-text search index missing: run 'flask --app app migrate-search'")
+
+    @app.cli.command('migrate-search')
+    def migrate_search():
+        """Ajoute la colonne tsvector et l'index GIN sur une table existante"""
+        if ensure_search_index(db.engine):
+            click.echo('Search index created')
+        else:
+            click.echo('Search index already present')
+
+
+def tokenize(query):
+    """Découpe la requête en mots, en ignorant toute syntaxe d'opérateur"""
+    return _TOKEN_RE.findall((query or '')[:MAX_QUERY_LENGTH].lower())
+
+
+def build_match_expression(tokens, dialect):
+    """Construit l'expression de recherche (tous les mots, préfixe sur le dernier)"""
+    if dialect == 'postgresql':
+        terms = [f"{token}:*" if i == len(tokens) - 1 else token
+                 for i, token in enumerate(tokens)]
+        return ' & '.join(terms)
+    terms = [f'"{token}"*' if i == len(tokens) - 1 else f'"{token}"'
+             for i, token in enumerate(tokens)]
+    return ' AND '.join(terms)
+
+
+def search_products(session, tokens, page, per_page):
+    """
+    Exécute la recherche classée.
+    Retourne (liste de (product_id, rank), total)
+    """
+    dialect = session.get_bind().dialect.name
+    sql = _PG_SEARCH if dialect == 'postgresql' else _SQLITE_SEARCH
+    match = build_match_expression(tokens, dialect)
+    offset = (page - 1) * per_page
+    rows = session.execute(text(sql), {
+        'query': match,
+        'limit': per_page,
+        'offset': offset,
+    }).fetchall()
+
+    if rows:
+        total = rows[0].total
+    elif offset:
+        # Page vide au-delà de la dernière: le total fenêtré n'existe pas
+        count_sql = _PG_COUNT if dialect == 'postgresql' else _SQLITE_COUNT
+        total = session.execute(text(count_sql), {'query': match}).scalar()
+    else:
+        total = 0
+    return [(row.id, float(row.rank)) for row in rows], total
+
+
+def _query_digest(tokens):
+    return hashlib.sha1(' '.join(tokens).encode()).hexdigest()
+
+
+def get_cached_results(redis_client, tokens, page, per_page):
+    """
+    Compte la popularité de la requête et renvoie (cache_key, résultat en cache).
+    cache_key vaut None si la requête n'est pas (encore) populaire.
+    """
+    if not redis_client:
+        return None, None
+
+    digest = _query_digest(tokens)
+    hits_key = f'products:search:hits:{digest}'
+    pipe = redis_client.pipeline()
+    pipe.incr(hits_key)
+    pipe.expire(hits_key, POPULAR_WINDOW)
+    pipe.get(SEARCH_VERSION_KEY)
+    results = pipe.execute()
+    if not results:
+        return None, None
+    hits, _, version = results
+
+    if hits < POPULAR_THRESHOLD:
+        return None, None
+
+    cache_key = f'products:search:{version or 0}:{digest}:{page}:{per_page}'
+    cached = redis_client.get(cache_key)
+    return cache_key, json.loads(cached) if cached else None
+
+
+def cache_results(redis_client, cache_key, payload):
+    """Met en cache le résultat d'une requête populaire"""
+    if redis_client and cache_key:
+        redis_client.setex(cache_key, RESULT_CACHE_TTL, json.dumps(payload))
+
+
+def invalidate_search_cache(redis_client):
+    """Invalide tous les résultats en cache en changeant de version"""
+    if redis_client:
+        redis_client.incr(SEARCH_VERSION_KEY)
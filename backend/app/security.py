@@ -4,7 +4,7 @@ Implémente: Rate limiting, CORS, JWT, validation, headers de sécurité
 """
 
 from functools import wraps
-from flask import request, jsonify
+from flask import g, request, jsonify
 import time
 from collections import defaultdict
 import re
@@ -149,13 +149,27 @@ def verify_csrf_token(token):
 
 # Decorator pour vérifier les permissions
 def require_role(role):
-    """Decorator pour vérifier le rôle de l'utilisateur"""
+    """Decorator pour vérifier le rôle de l'utilisateur (token Bearer signé)"""
     def decorator(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            # En production, vérifier le JWT ou la session
-            user_role = request.headers.get('X-User-Role', 'guest')
+            from app import auth
             
+            token = auth.get_bearer_token(request)
+            if not token:
+                return jsonify({"error": "Authentication required"}), 401
+            
+            try:
+                claims = auth.token_verifier.verify(token)
+            except auth.TokenError as e:
+                log_security_event(
+                    "INVALID_TOKEN",
+                    f"Rejected token on {request.path}: {e}",
+                    "WARNING"
+                )
+                return jsonify({"error": "Invalid or expired token"}), 401
+            
+            user_role = claims.get('role', 'guest')
             if user_role != role and user_role != 'admin':
                 log_security_event(
                     "UNAUTHORIZED_ACCESS",
@@ -164,6 +178,7 @@ def require_role(role):
                 )
                 return jsonify({"error": "Insufficient permissions"}), 403
             
+            g.token_claims = claims
             return f(*args, **kwargs)
         return wrapped
     return decorator
@@ -0,0 +1,54 @@
+"""
+Benchmark du coût d'authentification par requête (require_role)
+Cache froid: chaque appel vérifie la signature
+Cache chaud: le token est déjà dans le cache LRU
+
+Usage: python benchmarks/bench_auth.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from app import auth
+from app.security import require_role
+
+
+def run(label, app, headers, iterations, before_call=None):
+    @require_role('editor')
+    def handler():
+        return 'ok'
+
+    with app.test_request_context('/api/products', method='POST', headers=headers):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            if before_call:
+                before_call()
+            handler()
+        elapsed = time.perf_counter() - start
+
+    print(f"{label:<12} {elapsed / iterations * 1e6:8.2f} µs/request")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'bench'
+    app.config['AUTH_SIGNING_KEYS'] = 'k1:bench-secret-1,k0:bench-secret-0'
+    verifier = auth.init_auth(app)
+
+    token = verifier.issue({'sub': 'bench', 'role': 'editor'})
+    headers = {'Authorization': f'Bearer {token}'}
+
+    print(f"{iterations} iterations")
+    run('cold cache', app, headers, iterations, before_call=verifier.clear_cache)
+    run('warm cache', app, headers, iterations)
+    print(f"cache hits={verifier.hits} misses={verifier.misses}")
+
+
+if __name__ == '__main__':
+    main()
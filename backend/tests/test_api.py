@@ -1,10 +1,21 @@
+import json
+import os
 import pytest
+import threading
+import time
+from flask import Flask
 from app import create_app, db
+from app import auth, db_breaker
+from app import export, profiling
+from app.resilience import PROBE, BreakerRedis, CircuitBreaker
 from app.models import User, Product
+from app.search import ensure_search_index
+from sqlalchemy import text
 
 @pytest.fixture
-def app():
+def app(monkeypatch):
     """Create application for testing"""
+    monkeypatch.setenv('AUTH_SIGNING_KEYS', 'test:test-signing-key')
     app = create_app()
     app.config['TESTING'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
@@ -20,6 +31,12 @@ def client(app):
     """Test client"""
     return app.test_client()
 
+@pytest.fixture
+def auth_headers(app):
+    """Authorization header with an admin token"""
+    token = auth.token_verifier.issue({'sub': 'test', 'role': 'admin'})
+    return {'Authorization': f'Bearer {token}'}
+
 def test_health_check(client):
     """Test health check endpoint"""
     response = client.get('/api/health')
@@ -35,24 +52,24 @@ def test_ready_check(client):
     data = response.get_json()
     assert data['status'] == 'ready'
 
-def test_create_user(client):
+def test_create_user(client, auth_headers):
     """Test creating a user"""
     response = client.post('/api/users', json={
         'username': 'testuser',
         'email': 'test@example.com'
-    })
+    }, headers=auth_headers)
     assert response.status_code == 201
     data = response.get_json()
     assert data['username'] == 'testuser'
     assert data['email'] == 'test@example.com'
 
-def test_get_users(client):
+def test_get_users(client, auth_headers):
     """Test getting all users"""
     # Create a user first
     client.post('/api/users', json={
         'username': 'testuser',
         'email': 'test@example.com'
-    })
+    }, headers=auth_headers)
     
     response = client.get('/api/users')
     assert response.status_code == 200
@@ -60,13 +77,13 @@ def test_get_users(client):
     assert 'users' in data
     assert len(data['users']) > 0
 
-def test_get_user(client):
+def test_get_user(client, auth_headers):
     """Test getting a specific user"""
     # Create a user
     create_response = client.post('/api/users', json={
         'username': 'testuser',
         'email': 'test@example.com'
-    })
+    }, headers=auth_headers)
     user_id = create_response.get_json()['id']
     
     response = client.get(f'/api/users/{user_id}')
@@ -74,62 +91,62 @@ def test_get_user(client):
     data = response.get_json()
     assert data['id'] == user_id
 
-def test_delete_user(client):
+def test_delete_user(client, auth_headers):
     """Test deleting a user"""
     # Create a user
     create_response = client.post('/api/users', json={
         'username': 'testuser',
         'email': 'test@example.com'
-    })
+    }, headers=auth_headers)
     user_id = create_response.get_json()['id']
     
-    response = client.delete(f'/api/users/{user_id}')
+    response = client.delete(f'/api/users/{user_id}', headers=auth_headers)
     assert response.status_code == 200
     
     # Verify deletion
     get_response = client.get(f'/api/users/{user_id}')
     assert get_response.status_code == 404
 
-def test_create_product(client):
+def test_create_product(client, auth_headers):
     """Test creating a product"""
     response = client.post('/api/products', json={
         'name': 'Test Product',
         'description': 'A test product',
         'price': 29.99,
         'stock': 100
-    })
+    }, headers=auth_headers)
     assert response.status_code == 201
     data = response.get_json()
     assert data['name'] == 'Test Product'
     assert data['price'] == 29.99
 
-def test_get_products(client):
+def test_get_products(client, auth_headers):
     """Test getting all products"""
     # Create a product
     client.post('/api/products', json={
         'name': 'Test Product',
         'price': 29.99
-    })
+    }, headers=auth_headers)
     
     response = client.get('/api/products')
     assert response.status_code == 200
     data = response.get_json()
     assert 'products' in data
 
-def test_update_product(client):
+def test_update_product(client, auth_headers):
     """Test updating a product"""
     # Create a product
     create_response = client.post('/api/products', json={
         'name': 'Test Product',
         'price': 29.99
-    })
+    }, headers=auth_headers)
     product_id = create_response.get_json()['id']
     
     # Update it
     response = client.put(f'/api/products/{product_id}', json={
         'name': 'Updated Product',
         'price': 39.99
-    })
+    }, headers=auth_headers)
     assert response.status_code == 200
     data = response.get_json()
     assert data['name'] == 'Updated Product'
@@ -142,3 +159,534 @@ def test_get_stats(client):
     data = response.get_json()
     assert 'users' in data
     assert 'products' in data
+
+def test_search_products(client, auth_headers):
+    """Test full-text product search with ranking"""
+    client.post('/api/products', json={
+        'name': 'Wireless Keyboard',
+        'description': 'Compact keyboard',
+        'price': 49.99
+    }, headers=auth_headers)
+    client.post('/api/products', json={
+        'name': 'USB Hub',
+        'description': 'Works with any keyboard',
+        'price': 19.99
+    }, headers=auth_headers)
+    client.post('/api/products', json={
+        'name': 'Monitor',
+        'description': '27 inch display',
+        'price': 199.99
+    }, headers=auth_headers)
+    
+    response = client.get('/api/products/search?q=keyb')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['total'] == 2
+    assert data['products'][0]['name'] == 'Wireless Keyboard'
+    
+    response = client.get('/api/products/search?q=keyboard&per_page=1&page=2')
+    data = response.get_json()
+    assert data['total'] == 2
+    assert len(data['products']) == 1
+    assert data['products'][0]['name'] == 'USB Hub'
+    
+    response = client.get('/api/products/search?q=keyboard&page=5')
+    data = response.get_json()
+    assert data['products'] == []
+    assert data['total'] == 2
+
+def test_search_products_after_update(client, auth_headers):
+    """Test the search index follows product updates"""
+    create_response = client.post('/api/products', json={
+        'name': 'Old Name',
+        'price': 9.99
+    }, headers=auth_headers)
+    product_id = create_response.get_json()['id']
+    client.put(f'/api/products/{product_id}', json={'name': 'Fresh Name'}, headers=auth_headers)
+    
+    assert client.get('/api/products/search?q=old').get_json()['total'] == 0
+    assert client.get('/api/products/search?q=fresh').get_json()['total'] == 1
+
+def test_search_index_added_to_existing_table(app, client, auth_headers):
+    """Test the FTS index is created and backfilled for a pre-existing products table"""
+    client.post('/api/products', json={
+        'name': 'Legacy Lamp',
+        'price': 12.0
+    }, headers=auth_headers)
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE products_fts'))
+    
+    ensure_search_index(db.engine)
+    
+    assert client.get('/api/products/search?q=lamp').get_json()['total'] == 1
+
+def test_migrate_search_command(app, client, auth_headers):
+    """Test the one-off migration command is idempotent"""
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE products_fts'))
+    
+    runner = app.test_cli_runner()
+    assert 'created' in runner.invoke(args=['migrate-search']).output
+    assert 'already present' in runner.invoke(args=['migrate-search']).output
+
+def test_search_products_index_not_ready(app, client):
+    """Test search answers 503 until the index has been migrated"""
+    app.config['SEARCH_INDEX_READY'] = False
+    response = client.get('/api/products/search?q=lamp')
+    assert response.status_code == 503
+
+def test_search_products_page_out_of_range(client):
+    """Test a huge page number is rejected instead of overflowing"""
+    response = client.get('/api/products/search?q=lamp&page=99999999999999999999')
+    assert response.status_code == 400
+
+def test_search_products_requires_query(client):
+    """Test search without a query"""
+    response = client.get('/api/products/search?q=')
+    assert response.status_code == 400
+
+def test_export_products(client, auth_headers):
+    """Test streaming export of products as CSV and NDJSON"""
+    for i in range(3):
+        client.post('/api/products', json={
+            'name': f'Product {i}',
+            'price': 10.0 + i
+        }, headers=auth_headers)
+    
+    response = client.get('/api/export/products?format=csv', headers=auth_headers)
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).strip().splitlines()
+    assert lines[0].startswith('id,name,description,price')
+    assert len(lines) == 4
+    
+    response = client.get('/api/export/products?format=ndjson', headers=auth_headers)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['name'] for row in rows] == ['Product 0', 'Product 1', 'Product 2']
+
+def test_export_products_parquet(client, auth_headers):
+    """Test streaming export of products as Parquet"""
+    pq = pytest.importorskip('pyarrow.parquet')
+    import pyarrow as pa
+    for i in range(3):
+        client.post('/api/products', json={
+            'name': f'Product {i}',
+            'price': 10.0 + i
+        }, headers=auth_headers)
+    
+    response = client.get('/api/export/products?format=parquet', headers=auth_headers)
+    assert response.status_code == 200
+    table = pq.read_table(pa.BufferReader(response.get_data()))
+    assert table.num_rows == 3
+    assert table.column('name').to_pylist() == ['Product 0', 'Product 1', 'Product 2']
+
+def _wait_for_job(client, auth_headers, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/export/jobs/{job_id}', headers=auth_headers).get_json()
+        if job['status'] != 'running':
+            return job
+        time.sleep(0.05)
+    raise AssertionError('Export job did not finish')
+
+def test_export_job(client, auth_headers, tmp_path, monkeypatch):
+    """Test a background export: create, poll, then download"""
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path))
+    client.post('/api/products', json={'name': 'Job Product', 'price': 5.0},
+                headers=auth_headers)
+    
+    response = client.post('/api/export/jobs', json={
+        'resource': 'products',
+        'format': 'ndjson'
+    }, headers=auth_headers)
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    
+    assert _wait_for_job(client, auth_headers, job_id)['status'] == 'completed'
+    response = client.get(f'/api/export/jobs/{job_id}/download', headers=auth_headers)
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['name'] == 'Job Product'
+    response.close()
+
+def test_export_job_file_missing(client, auth_headers, tmp_path, monkeypatch):
+    """Test a completed job whose file is gone or on another instance"""
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path))
+    job = {
+        'id': 'gone',
+        'resource': 'products',
+        'format': 'csv',
+        'status': 'completed',
+        'host': export.HOSTNAME,
+        'path': str(tmp_path / 'products-gone.csv'),
+        'created_at': time.time()
+    }
+    export.save_job(None, job)
+    response = client.get('/api/export/jobs/gone/download', headers=auth_headers)
+    assert response.status_code == 404
+    
+    export.save_job(None, dict(job, host='other-pod'))
+    response = client.get('/api/export/jobs/gone/download', headers=auth_headers)
+    assert response.status_code == 409
+    assert response.get_json()['host'] == 'other-pod'
+
+def test_export_invalid_format(client, auth_headers):
+    """Test export with an unsupported format or resource"""
+    assert client.get('/api/export/products?format=xml', headers=auth_headers).status_code == 400
+    assert client.get('/api/export/orders', headers=auth_headers).status_code == 404
+
+def test_export_requires_admin(client):
+    """Test exports and export jobs are admin only"""
+    assert client.get('/api/export/users').status_code == 401
+    assert client.post('/api/export/jobs', json={'resource': 'users'}).status_code == 401
+    
+    editor = auth.token_verifier.issue({'role': 'editor'})
+    response = client.get('/api/export/users', headers={'Authorization': f'Bearer {editor}'})
+    assert response.status_code == 403
+
+def test_export_jobs_expire(tmp_path, monkeypatch):
+    """Test expired export jobs are dropped from memory and disk"""
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path))
+    old_file = tmp_path / 'products-old.csv'
+    old_file.write_text('id\n')
+    old = time.time() - export.JOB_TTL - 1
+    os.utime(old_file, (old, old))
+    export.save_job(None, {'id': 'old', 'created_at': old})
+    
+    assert export.get_job(None, 'old') is None
+    assert 'old' not in export._local_jobs
+    assert not old_file.exists()
+
+def test_export_job_store_unavailable():
+    """Test an unknown job is not reported missing while Redis is unreachable"""
+    breaker = CircuitBreaker('test-export', min_calls=1)
+    breaker.record_failure()
+    redis_proxy = BreakerRedis(None, breaker)
+    
+    with pytest.raises(export.JobStoreUnavailable):
+        export.get_job(redis_proxy, 'unknown')
+
+def test_write_requires_token(client):
+    """Test write routes reject missing, forged and under-privileged tokens"""
+    payload = {'name': 'Test Product', 'price': 29.99}
+    assert client.post('/api/products', json=payload).status_code == 401
+    
+    forged = auth.TokenVerifier({'other': b'secret'}).issue({'role': 'admin'})
+    response = client.post('/api/products', json=payload,
+                           headers={'Authorization': f'Bearer {forged}'})
+    assert response.status_code == 401
+    
+    viewer = auth.token_verifier.issue({'role': 'viewer'})
+    response = client.post('/api/products', json=payload,
+                           headers={'Authorization': f'Bearer {viewer}'})
+    assert response.status_code == 403
+
+def test_auth_requires_signing_keys():
+    """Test the app refuses to start without signing keys"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
+    with pytest.raises(RuntimeError):
+        auth.init_auth(app)
+
+def test_token_verifier_cache():
+    """Test verified tokens are cached until expiry and across key rotation"""
+    verifier = auth.TokenVerifier({'k1': b'secret1'}, cache_size=2)
+    token = verifier.issue({'role': 'admin'})
+    assert verifier.verify(token)['role'] == 'admin'
+    assert verifier.verify(token)['role'] == 'admin'
+    assert (verifier.hits, verifier.misses) == (1, 1)
+    
+    expired = verifier.issue({'role': 'admin', 'exp': 1})
+    with pytest.raises(auth.TokenError):
+        verifier.verify(expired)
+    
+    verifier.rotate({'k2': b'secret2', 'k1': b'secret1'})
+    assert verifier.verify(token)['role'] == 'admin'
+    verifier.rotate({'k2': b'secret2'})
+    with pytest.raises(auth.TokenError):
+        verifier.verify(token)
+
+class FakeRedis:
+    """Minimal in-memory Redis for the idempotency middleware"""
+    
+    def __init__(self):
+        self.store = {}
+    
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+    
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+    
+    def get(self, key):
+        return self.store.get(key)
+    
+    def delete(self, key):
+        self.store.pop(key, None)
+
+def test_idempotency_key_replays_response(client, auth_headers, monkeypatch):
+    """Test a retried POST with the same Idempotency-Key is not executed twice"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'redis_client', FakeRedis())
+    headers = {**auth_headers, 'Idempotency-Key': 'create-42'}
+    payload = {'name': 'Test Product', 'price': 29.99}
+    
+    first = client.post('/api/products', json=payload, headers=headers)
+    second = client.post('/api/products', json=payload, headers=headers)
+    assert first.status_code == second.status_code == 201
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert Product.query.count() == 1
+    
+    conflict = client.post('/api/products', json={**payload, 'price': 1.0}, headers=headers)
+    assert conflict.status_code == 422
+
+def test_idempotency_key_survives_token_refresh(client, monkeypatch):
+    """Test the key is scoped by the token subject, not the raw token"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'redis_client', FakeRedis())
+    payload = {'name': 'Test Product', 'price': 29.99}
+    
+    for iat in (int(time.time()) - 10, int(time.time())):
+        token = auth.token_verifier.issue({'sub': 'alice', 'role': 'admin', 'iat': iat})
+        response = client.post('/api/products', json=payload, headers={
+            'Authorization': f'Bearer {token}',
+            'Idempotency-Key': 'refresh-1'
+        })
+        assert response.status_code == 201
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert Product.query.count() == 1
+
+class InFlightRedis(FakeRedis):
+    """A concurrent request already holds every key; it completes after `completes_after` reads"""
+    
+    def __init__(self, completes_after=None):
+        super().__init__()
+        self.completes_after = completes_after
+        self.reads = 0
+    
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key not in self.store:
+            self.store[key] = value  # claimed by the concurrent duplicate
+            return None
+        return super().set(key, value, nx=nx, ex=ex)
+    
+    def get(self, key):
+        self.reads += 1
+        if self.completes_after is not None and self.reads >= self.completes_after:
+            record = json.loads(self.store[key])
+            record.update(state='completed', status=201, body='{"id": 7}',
+                          mimetype='application/json')
+            self.store[key] = json.dumps(record)
+        return super().get(key)
+
+def test_idempotency_waits_for_concurrent_duplicate(client, auth_headers, monkeypatch):
+    """Test a duplicate waits for the in-progress request and replays its response"""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'redis_client', InFlightRedis(completes_after=3))
+    
+    response = client.post('/api/products', json={'name': 'Test Product', 'price': 29.99},
+                           headers={**auth_headers, 'Idempotency-Key': 'concurrent'})
+    assert response.status_code == 201
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert response.get_json() == {'id': 7}
+    assert Product.query.count() == 0
+
+def test_idempotency_conflict_after_wait(client, auth_headers, monkeypatch):
+    """Test a duplicate gets 409 + Retry-After when the original is still running"""
+    import app as app_module
+    from app import middleware
+    monkeypatch.setattr(app_module, 'redis_client', InFlightRedis())
+    monkeypatch.setattr(middleware, 'IDEMPOTENCY_WAIT', 0.2)
+    
+    response = client.post('/api/products', json={'name': 'Test Product', 'price': 29.99},
+                           headers={**auth_headers, 'Idempotency-Key': 'stuck'})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert Product.query.count() == 0
+
+def test_circuit_breaker_transitions():
+    """Test the breaker opens on failure rate and closes after a half-open probe"""
+    breaker = CircuitBreaker('test', failure_rate=0.5, window_size=4, min_calls=4, open_timeout=0)
+    for _ in range(2):
+        breaker.record_success()
+        breaker.record_failure()
+    assert breaker.state == 'half_open'  # open_timeout=0: immediately probing
+    
+    assert breaker.allow_request() == PROBE
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+def _half_open_breaker_with_probe_in_flight(name):
+    breaker = CircuitBreaker(name, min_calls=1, open_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request() == PROBE
+    return breaker
+
+def test_redis_breaker_releases_probe_on_unexpected_error():
+    """Test a half-open Redis probe failing with a non-Redis error frees its slot"""
+    breaker = CircuitBreaker('test-redis', min_calls=1, open_timeout=0)
+    breaker.record_failure()
+    
+    class BrokenRedis:
+        def get(self, key):
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+    
+    redis_proxy = BreakerRedis(BrokenRedis(), breaker)
+    with pytest.raises(UnicodeDecodeError):
+        redis_proxy.get('key')
+    assert breaker.allow_request() == PROBE
+
+def test_idempotency_passes_through_when_redis_rejected(client, auth_headers, monkeypatch):
+    """Test keyed requests do not spin while the Redis breaker rejects calls"""
+    import app as app_module
+    breaker = _half_open_breaker_with_probe_in_flight('test-idempotency')
+    monkeypatch.setattr(app_module, 'redis_client', BreakerRedis(FakeRedis(), breaker))
+    
+    start = time.monotonic()
+    response = client.post('/api/products', json={'name': 'Test Product', 'price': 29.99},
+                           headers={**auth_headers, 'Idempotency-Key': 'half-open'})
+    assert response.status_code == 201
+    assert time.monotonic() - start < 1
+
+def test_database_breaker_sheds_load(client):
+    """Test requests fail fast with 503 while the database breaker is open"""
+    try:
+        while db_breaker.state == 'closed':
+            db_breaker.record_failure()
+        
+        response = client.get('/api/products')
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        
+        health = client.get('/api/health').get_json()
+        assert health['circuit_breakers']['database'] == 'open'
+    finally:
+        db_breaker.reset()
+
+def test_database_breaker_rejections_keep_probe_slot(client, monkeypatch):
+    """Test rejected requests during half-open do not free the in-flight probe's slot"""
+    monkeypatch.setattr(db_breaker, 'open_timeout', 0)
+    try:
+        while db_breaker.state == 'closed':
+            db_breaker.record_failure()
+        assert db_breaker.allow_request() == PROBE
+        
+        statuses = [client.get('/api/products').status_code for _ in range(5)]
+        assert statuses == [503] * 5
+    finally:
+        db_breaker.reset()
+
+def test_profiling_requires_admin(client):
+    """Test diagnostics endpoints are admin only"""
+    token = auth.token_verifier.issue({'role': 'editor'})
+    response = client.get('/api/debug/memory', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 403
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+def test_cpu_profile(client, auth_headers, tmp_path, monkeypatch):
+    """Test sampling CPU profile returns collapsed stacks of busy threads only"""
+    monkeypatch.setattr(profiling, 'RESULT_DIR', str(tmp_path))
+    stop = threading.Event()
+    busy = threading.Thread(target=_busy_loop, args=(stop,))
+    idle = threading.Thread(target=stop.wait)
+    busy.start()
+    idle.start()
+    try:
+        response = client.post('/api/debug/profile/cpu', json={'seconds': 0.2},
+                               headers=auth_headers)
+        assert response.status_code == 202
+        assert response.get_json()['worker'] == {'host': profiling.HOSTNAME, 'pid': os.getpid()}
+        assert response.headers['X-Worker-Pid'] == str(os.getpid())
+        
+        for _ in range(50):
+            response = client.get('/api/debug/profile/cpu', headers=auth_headers)
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        busy.join()
+        idle.join()
+    assert response.status_code == 200
+    stacks = response.get_data(as_text=True).splitlines()
+    assert any('_busy_loop' in stack for stack in stacks)
+    assert not any(stack.rsplit(' ', 1)[0].endswith('wait (threading.py)') for stack in stacks)
+    assert profiling.cpu_profile_status()['idle_samples'] > 0
+
+def test_debug_results_from_another_worker(client, auth_headers, tmp_path, monkeypatch):
+    """Test published results of another worker of the same pod are readable"""
+    monkeypatch.setattr(profiling, 'RESULT_DIR', str(tmp_path))
+    routes = {'GET /api/products': {'requests': 2, 'net_blocks': 10, 'net_bytes': 640}}
+    with monkeypatch.context() as m:
+        m.setattr(profiling.os, 'getpid', lambda: 4242)
+        profiling.publish_result(None, 'route_allocations', routes)
+    
+    response = client.get('/api/debug/memory/routes?pid=4242', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()['routes'] == routes
+    assert response.get_json()['worker'] == {'host': profiling.HOSTNAME, 'pid': 4242}
+    
+    response = client.get('/api/debug/memory/routes?pid=4243', headers=auth_headers)
+    assert response.status_code == 404
+    assert client.get('/api/debug/memory/routes?pid=x', headers=auth_headers).status_code == 400
+
+def test_debug_results_from_another_pod(client, auth_headers, monkeypatch):
+    """Test results of a worker on another pod are read from Redis"""
+    from app import routes
+    fake = FakeRedis()
+    fake.setex('debug:other-pod:7:cpu_profile', 60, json.dumps({
+        'worker': {'host': 'other-pod', 'pid': 7},
+        'published_at': time.time(),
+        'data': 'main (app.py);handler (routes.py) 3'
+    }))
+    monkeypatch.setattr(routes, 'redis_client', fake)
+    
+    response = client.get('/api/debug/profile/cpu?host=other-pod&pid=7', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == 'main (app.py);handler (routes.py) 3'
+    
+    breaker = CircuitBreaker('test-debug', min_calls=1)
+    breaker.record_failure()
+    monkeypatch.setattr(routes, 'redis_client', BreakerRedis(fake, breaker))
+    response = client.get('/api/debug/profile/cpu?host=other-pod&pid=7', headers=auth_headers)
+    assert response.status_code == 503
+
+def test_profiling_available_while_database_breaker_open(client, auth_headers):
+    """Test diagnostics endpoints bypass the database fast-fail"""
+    try:
+        while db_breaker.state == 'closed':
+            db_breaker.record_failure()
+        response = client.get('/api/debug/memory', headers=auth_headers)
+        assert response.status_code == 200
+    finally:
+        db_breaker.reset()
+
+def test_memory_snapshot_and_routes(client, auth_headers, tmp_path, monkeypatch):
+    """Test tracemalloc snapshots, diffs and per-route allocation counts"""
+    monkeypatch.setattr(profiling, 'RESULT_DIR', str(tmp_path))
+    response = client.post('/api/debug/memory/start',
+                           json={'frames': 5, 'track_routes': True}, headers=auth_headers)
+    assert response.status_code == 200
+    try:
+        response = client.post('/api/debug/memory/snapshot', json={}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.get_json()['top']
+        published = client.get('/api/debug/memory/snapshot', headers=auth_headers).get_json()
+        assert published['top'] == response.get_json()['top']
+        
+        client.get('/api/products')
+        response = client.get('/api/debug/memory/diff', headers=auth_headers)
+        assert response.status_code == 200
+        assert 'size_diff_bytes' in response.get_json()['diff'][0]
+        
+        routes = client.get('/api/debug/memory/routes', headers=auth_headers).get_json()['routes']
+        assert routes['GET /api/products']['requests'] == 1
+    finally:
+        client.post('/api/debug/memory/stop', json={}, headers=auth_headers)
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { WRITES_ENABLED, WRITE_ACCESS_NOTICE, writeErrorMessage } from '../writeAccess';
 
 const API_URL = process.env.REACT_APP_API_URL || '/api';
 
@@ -15,6 +16,7 @@ function Products() {
     stock: ''
   });
   const [message, setMessage] = useState({ type: '', text: '' });
+  const [searchQuery, setSearchQuery] = useState('');
 
   useEffect(() => {
     fetchProducts();
@@ -32,6 +34,23 @@ function Products() {
     }
   };
 
+  const handleSearch = async (e) => {
+    e.preventDefault();
+    if (!searchQuery.trim()) {
+      fetchProducts();
+      return;
+    }
+    try {
+      const response = await axios.get(`${API_URL}/products/search`, {
+        params: { q: searchQuery }
+      });
+      setProducts(response.data.products || []);
+    } catch (error) {
+      console.error('Error searching products:', error);
+      setMessage({ type: 'error', text: 'Failed to search products' });
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     try {
@@ -59,7 +78,7 @@ function Products() {
     } catch (error) {
       setMessage({ 
         type: 'error', 
-        text: error.response?.data?.error || 'Failed to save product' 
+        text: writeErrorMessage(error, 'Failed to save product') 
       });
     }
   };
@@ -84,7 +103,7 @@ function Products() {
       fetchProducts();
       setTimeout(() => setMessage({ type: '', text: '' }), 3000);
     } catch (error) {
-      setMessage({ type: 'error', text: 'Failed to delete product' });
+      setMessage({ type: 'error', text: writeErrorMessage(error, 'Failed to delete product') });
     }
   };
 
@@ -106,18 +125,39 @@ function Products() {
           <button 
             className="btn btn-primary" 
             onClick={() => setShowForm(!showForm)}
+            disabled={!WRITES_ENABLED}
+            title={WRITES_ENABLED ? undefined : WRITE_ACCESS_NOTICE}
           >
             {showForm ? 'Cancel' : '+ Add Product'}
           </button>
         </div>
 
+        {!WRITES_ENABLED && (
+          <div className="info">
+            {WRITE_ACCESS_NOTICE}
+          </div>
+        )}
+
         {message.text && (
           <div className={message.type}>
             {message.text}
           </div>
         )}
 
-        {showForm && (
+        <form onSubmit={handleSearch} style={{ display: 'flex', gap: '1rem', marginBottom: '1.5rem' }}>
+          <input
+            type="search"
+            placeholder="Search products..."
+            value={searchQuery}
+            onChange={(e) => setSearchQuery(e.target.value)}
+            style={{ flex: 1 }}
+          />
+          <button type="submit" className="btn btn-secondary">
+            Search
+          </button>
+        </form>
+
+        {WRITES_ENABLED && showForm && (
           <form onSubmit={handleSubmit} style={{ marginBottom: '2rem' }}>
             <div className="form-group">
               <label>Name</label>
@@ -200,12 +240,16 @@ function Products() {
                         <button 
                           className="btn btn-primary btn-small"
                           onClick={() => handleEdit(product)}
+                          disabled={!WRITES_ENABLED}
+                          title={WRITES_ENABLED ? undefined : WRITE_ACCESS_NOTICE}
                         >
                           Edit
                         </button>
                         <button 
                           className="btn btn-danger btn-small"
                           onClick={() => handleDelete(product.id)}
+                          disabled={!WRITES_ENABLED}
+                          title={WRITES_ENABLED ? undefined : WRITE_ACCESS_NOTICE}
                         >
                           Delete
                         </button>
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { WRITES_ENABLED, WRITE_ACCESS_NOTICE, writeErrorMessage } from '../writeAccess';
 
 const API_URL = process.env.REACT_APP_API_URL || '/api';
 
@@ -38,7 +39,7 @@ function Users() {
     } catch (error) {
       setMessage({ 
         type: 'error', 
-        text: error.response?.data?.error || 'Failed to create user' 
+        text: writeErrorMessage(error, 'Failed to create user') 
       });
     }
   };
@@ -52,7 +53,7 @@ function Users() {
       fetchUsers();
       setTimeout(() => setMessage({ type: '', text: '' }), 3000);
     } catch (error) {
-      setMessage({ type: 'error', text: 'Failed to delete user' });
+      setMessage({ type: 'error', text: writeErrorMessage(error, 'Failed to delete user') });
     }
   };
 
@@ -68,18 +69,26 @@ function Users() {
           <button 
             className="btn btn-primary" 
             onClick={() => setShowForm(!showForm)}
+            disabled={!WRITES_ENABLED}
+            title={WRITES_ENABLED ? undefined : WRITE_ACCESS_NOTICE}
           >
             {showForm ? 'Cancel' : '+ Add User'}
           </button>
         </div>
 
+        {!WRITES_ENABLED && (
+          <div className="info">
+            {WRITE_ACCESS_NOTICE}
+          </div>
+        )}
+
         {message.text && (
           <div className={message.type}>
             {message.text}
           </div>
         )}
 
-        {showForm && (
+        {WRITES_ENABLED && showForm && (
           <form onSubmit={handleSubmit} style={{ marginBottom: '2rem' }}>
             <div className="form-group">
               <label>Username</label>
@@ -133,6 +142,8 @@ function Users() {
                         <button 
                           className="btn btn-danger btn-small"
                           onClick={() => handleDelete(user.id)}
+                          disabled={!WRITES_ENABLED}
+                          title={WRITES_ENABLED ? undefined : WRITE_ACCESS_NOTICE}
                         >
                           Delete
                         </button>
@@ -0,0 +1,15 @@
+// Les routes d'écriture exigent un token Bearer (rôle editor/admin) et
+// l'interface n'a pas encore de connexion: elle reste en lecture seule.
+export const WRITES_ENABLED = false;
+
+export const WRITE_ACCESS_NOTICE =
+  'Read-only mode: creating, editing and deleting requires an editor or admin token, ' +
+  'and this interface has no sign-in yet. Use the API with a token from "flask issue-token".';
+
+export function writeErrorMessage(error, fallback) {
+  const status = error.response?.status;
+  if (status === 401 || status === 403) {
+    return WRITE_ACCESS_NOTICE;
+  }
+  return error.response?.data?.error || fallback;
+}
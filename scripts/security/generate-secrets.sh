@@ -25,6 +25,7 @@ generate_password() {
 echo -e "${YELLOW}Création du secret application...${NC}"
 kubectl create secret generic app-secrets \
     --from-literal=secret-key=$(generate_secret) \
+    --from-literal=auth-signing-keys=k1:$(generate_secret) \
     --namespace=microservices \
     --dry-run=client -o yaml > k8s/backend/app-secrets.yaml
 